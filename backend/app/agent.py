@@ -1,11 +1,12 @@
 
+import asyncio
 import datetime
 
 import os
 import PyPDF2
-import requests
 
 import re
+import time
 import logging
 
 
@@ -15,14 +16,18 @@ from google.adk.agents import BaseAgent, LlmAgent, LoopAgent, SequentialAgent
 from google.adk.agents.callback_context import CallbackContext
 from google.adk.agents.invocation_context import InvocationContext
 from google.adk.events import Event, EventActions
+from google.adk.models import LlmResponse
 from google.adk.planners import BuiltInPlanner
 from google.adk.tools import google_search
 from google.adk.tools.agent_tool import AgentTool
+from google.adk.tools.tool_context import ToolContext
 from google.genai import types as genai_types
 from pydantic import BaseModel, Field
 
-from .instructions import PLANNER_GENERATOR_PROMPT,INTERACTIVE_PLANNER_AGENT_PROMPT, SECTION_PLANNER_AGENT_PROMPT, BASE_RETRIVER_AGENT_PROMPT, BASE_CONTRA_AGENT_PROMPT, HYPOTHESIS_AGENT_PROMPT, REPORT_COMPOSER_AGENT_PROMPT
+from .instructions import PLANNER_GENERATOR_PROMPT,INTERACTIVE_PLANNER_AGENT_PROMPT, SECTION_PLANNER_AGENT_PROMPT, BASE_RETRIVER_AGENT_PROMPT, BASE_CONTRA_AGENT_PROMPT, HYPOTHESIS_AGENT_PROMPT, REPORT_COMPOSER_AGENT_PROMPT, RESEARCH_EVALUATOR_PROMPT
 from .config import config
+from .paper_cache import collect_garbage, fetch_cached_pdf, open_cached_pdf
+from .rate_limit import RateLimitExceeded, rate_limited_get, summarize_rate_limits, track_rate_limits
 
 
 # --- Structured Output Models ---
@@ -52,7 +57,7 @@ class Feedback(BaseModel):
 # --- Tools ---
 BASE_URL = "https://www.ebi.ac.uk/europepmc/webservices/rest/search"
 
-BASE_PAPERS_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "papers"))
+BASE_PAPERS_PATH = config.papers_path
 
 # --- Utility Functions ---
 def search_papers(query: str, cursor_mark: str = "*", page_size: int = 25):
@@ -64,7 +69,7 @@ def search_papers(query: str, cursor_mark: str = "*", page_size: int = 25):
         "cursorMark": cursor_mark,
         "pageSize": page_size
     }
-    response = requests.get(BASE_URL, params=params)
+    response = rate_limited_get(BASE_URL, params=params)
     response.raise_for_status()
     data = response.json()
     return data.get("resultList", {}).get("result", []), data.get("nextCursorMark")
@@ -72,7 +77,7 @@ def search_papers(query: str, cursor_mark: str = "*", page_size: int = 25):
 
 def download_pdf(url: str, path: str):
     """Download PDF to specified path."""
-    response = requests.get(url, stream=True, timeout=30)
+    response = rate_limited_get(url, stream=True, timeout=30)
     response.raise_for_status()
     if "pdf" not in response.headers.get("content-type", "").lower():
         raise Exception("Not a valid PDF file")
@@ -81,89 +86,148 @@ def download_pdf(url: str, path: str):
             f.write(chunk)
 
 
-def retrieve_papers(query: str, directory: str = BASE_PAPERS_PATH,
-                    max_papers: int = 5, max_pages: int = 25):
-    """Searches for and downloads scientific papers from Europe PMC."""
-    try:
-        cursor = "*"
-        downloaded_count = 0
-        papers_data = []
+async def retrieve_papers(query: str, max_papers: int = 5, max_pages: int = 25,
+                          tool_context: ToolContext | None = None):
+    """Searches for and downloads scientific papers from Europe PMC into the shared paper cache."""
+    # Rate limiting sleeps, so keep the blocking work off the shared event loop.
+    result = await asyncio.to_thread(_retrieve_papers, query, max_papers, max_pages)
+    if tool_context is not None:
+        record_rate_limit_metrics(tool_context.state, result)
 
-        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), directory))
-        os.makedirs(base_dir, exist_ok=True)
+    # Rate limiter metrics stay in session state; they would otherwise flow into
+    # `retrieved_papers` and from there into the evaluator and report prompts.
+    response = {key: result[key] for key in ("status", "query", "papers")}
+    if "message" in result:
+        response["message"] = result["message"]
+    elif result["throttled"]:
+        response["message"] = "Some requests were rate limited; fewer papers may have been retrieved."
+    return response
 
-        for _ in range(max_pages):
-            results, cursor = search_papers(query, cursor_mark=cursor)
-            if not results:
-                break
 
-            for paper in results:
-                if downloaded_count >= max_papers:
-                    return {"status": "success", "query": query, "papers": papers_data}
-
-                title = paper.get("title", "Unknown Title")
-                paper_id = paper.get("id", "unknown")
-                year = paper.get("pubYear")
-                author_list = paper.get("authorList", {}).get("author", [])
-                authors = [a.get("fullName") for a in author_list if isinstance(a, dict)] if author_list else []
-                journal = paper.get("journalTitle")
-
-                # Get open-access PDF links
-                full_texts = paper.get("fullTextUrlList", {}).get("fullTextUrl", [])
-                pdf_links = [
-                    u.get("url")
-                    for u in full_texts
-                    if u.get("documentStyle", "").lower() == "pdf"
-                    and "open" in u.get("availability", "").lower()
-                ]
-
-                if not pdf_links:
-                    continue
-
-                pdf_url = pdf_links[0]
-                pdf_name = f"{paper_id}.pdf"
-                pdf_path = os.path.join(base_dir, pdf_name)
-
-                try:
-                    download_pdf(pdf_url, pdf_path)
-                    downloaded_count += 1
-                    papers_data.append({
-                        "paperId": paper_id,
-                        "title": title,
-                        "year": year,
-                        "authors": authors,
-                        "journal": journal,
-                        "pdf_name": pdf_name,
-                        "pdf_url": pdf_url,
-                    })
-                except Exception:
-                    continue
-
-        return {"papers": papers_data}
-
-    except Exception as e:
-        return {"message": str(e)}
-    
-
-def load_all_pdfs(directory: str = BASE_PAPERS_PATH) -> dict:
+def _retrieve_papers(query: str, max_papers: int, max_pages: int,
+                     exclude_ids: frozenset[str] = frozenset(), deadline: float | None = None):
+    """
+    Implementation of `retrieve_papers`; papers in `exclude_ids` are skipped without counting.
+    No further pages or downloads are started once `deadline` (a `time.time()` value) passes.
+
+    Papers downloaded before a failure are always returned. "throttled" is set when
+    a host kept rate limiting us and requests were dropped.
+    """
+    papers_data = []
+    result = {"status": "success", "query": query, "papers": papers_data}
+
+    with track_rate_limits() as rate_limits:
+        try:
+            cursor = "*"
+            downloaded_count = 0
+
+            # Always the configured cache: GC deletes files, so never run it on a model-supplied path.
+            base_dir = BASE_PAPERS_PATH
+            os.makedirs(base_dir, exist_ok=True)
+            collect_garbage(base_dir)
+
+            for _ in range(max_pages):
+                if downloaded_count >= max_papers or _past(deadline):
+                    break
+                results, cursor = search_papers(query, cursor_mark=cursor)
+                if not results:
+                    break
+
+                for paper in results:
+                    if downloaded_count >= max_papers or _past(deadline):
+                        break
+
+                    title = paper.get("title", "Unknown Title")
+                    paper_id = paper.get("id", "unknown")
+                    if paper_id in exclude_ids:
+                        continue
+                    year = paper.get("pubYear")
+                    author_list = paper.get("authorList", {}).get("author", [])
+                    authors = [a.get("fullName") for a in author_list if isinstance(a, dict)] if author_list else []
+                    journal = paper.get("journalTitle")
+
+                    # Get open-access PDF links
+                    full_texts = paper.get("fullTextUrlList", {}).get("fullTextUrl", [])
+                    pdf_links = [
+                        u.get("url")
+                        for u in full_texts
+                        if u.get("documentStyle", "").lower() == "pdf"
+                        and "open" in u.get("availability", "").lower()
+                    ]
+
+                    if not pdf_links:
+                        continue
+
+                    pdf_url = pdf_links[0]
+                    pdf_name = f"{paper_id}.pdf"
+
+                    try:
+                        fetch_cached_pdf(pdf_url, base_dir, paper_id, download_pdf)
+                        downloaded_count += 1
+                        papers_data.append({
+                            "paperId": paper_id,
+                            "title": title,
+                            "year": year,
+                            "authors": authors,
+                            "journal": journal,
+                            "pdf_name": pdf_name,
+                            "pdf_url": pdf_url,
+                        })
+                    except Exception as e:
+                        logging.warning(f"Skipping paper {paper_id}: {e}")
+                        continue
+
+        except RateLimitExceeded as e:
+            logging.warning(f"Search for {query!r} stopped early with {len(papers_data)} paper(s): {e}")
+            result["message"] = str(e)
+        except Exception as e:
+            result["status"] = "error"
+            result["message"] = str(e)
+
+    result["throttled"] = any(m.dropped for m in rate_limits.values())
+    result["rate_limit"] = summarize_rate_limits(rate_limits)
+    return result
+
+
+def _past(deadline: float | None) -> bool:
+    return deadline is not None and time.time() >= deadline
+
+
+def record_rate_limit_metrics(state, result: dict) -> None:
+    """Adds the rate limiter metrics of one retrieval to the session's running totals."""
+    totals = dict(state.get("rate_limit_metrics") or {})
+    for host, metrics in result.get("rate_limit", {}).items():
+        host_totals = dict(totals.get(host, {}))
+        for key, value in metrics.items():
+            if key == "current_rate":
+                host_totals[key] = value
+            else:
+                host_totals[key] = host_totals.get(key, 0) + value
+        totals[host] = host_totals
+    state["rate_limit_metrics"] = totals
+    if result.get("throttled"):
+        logging.warning(f"Retrieval was throttled; rate limit metrics: {totals}")
+
+
+async def load_all_pdfs(tool_context: ToolContext) -> dict:
     """
-    Loads and extracts text from all PDF files in the specified directory.
+    Loads and extracts text from the PDF files of the papers retrieved in this session.
     """
-    # Normalize: if someone passes "./papers", convert to absolute
-    directory = os.path.abspath(directory)
-    print("Resolved PDF directory:", directory)
+    papers = tool_context.state.get("papers", {})
+    return await asyncio.to_thread(_load_pdfs, BASE_PAPERS_PATH, list(papers.values()))
 
-    if not os.path.exists(directory):
-        raise FileNotFoundError(f"Directory not found: {directory}")
 
+def _load_pdfs(directory: str, papers: list[dict]) -> dict:
+    """Reads each paper from the shared cache, holding its lock so GC cannot evict it mid-read."""
     pdf_texts = {}
-    for fname in os.listdir(directory):
-        if not fname.lower().endswith(".pdf"):
+    for paper in papers:
+        fname = paper.get("pdf_name")
+        if not fname:
             continue
-        pdf_path = os.path.join(directory, fname)
+        paper_id = os.path.splitext(fname)[0]
         text = ""
         try:
-            with open(pdf_path, 'rb') as file:
+            with open_cached_pdf(paper.get("pdf_url"), directory, paper_id, download_pdf) as file:
                 reader = PyPDF2.PdfReader(file)
                 for page in reader.pages:
                     page_text = page.extract_text()
@@ -193,10 +257,20 @@ def collect_retrieved_papers_callback(callback_context: CallbackContext) -> None
         except json.JSONDecodeError:
             retrieved_papers_raw = {}
 
-    retrieved_papers = retrieved_papers_raw.get("papers", [])
+    paper_id_to_short_id, papers = _merge_papers(
+        retrieved_papers_raw.get("papers", []),
+        callback_context.state.get("paper_id_to_short_id", {}),
+        callback_context.state.get("papers", {}),
+    )
+
+    callback_context.state["paper_id_to_short_id"] = paper_id_to_short_id
+    callback_context.state["papers"] = papers
 
-    paper_id_to_short_id = callback_context.state.get("paper_id_to_short_id", {})
-    papers = callback_context.state.get("papers", {})
+
+def _merge_papers(retrieved_papers: list, paper_id_to_short_id: dict, papers: dict) -> tuple[dict, dict]:
+    """Assigns short IDs to newly retrieved papers and adds them to the known papers."""
+    paper_id_to_short_id = dict(paper_id_to_short_id)
+    papers = dict(papers)
     id_counter = len(paper_id_to_short_id) + 1
 
     for paper in retrieved_papers:
@@ -220,8 +294,79 @@ def collect_retrieved_papers_callback(callback_context: CallbackContext) -> None
                 "pdf_url": paper.get("pdf_url")
             }
 
-    callback_context.state["paper_id_to_short_id"] = paper_id_to_short_id
-    callback_context.state["papers"] = papers
+    return paper_id_to_short_id, papers
+
+
+def start_refinement_callback(callback_context: CallbackContext) -> None:
+    """Resets the refinement loop's budget counters at the start of each run."""
+    now = time.time()
+    state = callback_context.state
+    state["refinement_started_at"] = now
+    state["refinement_deadline"] = (
+        now + config.refinement_time_budget_seconds if config.refinement_time_budget_seconds else None
+    )
+    state["refinement_tokens_used"] = 0
+    state["refinement_iteration_starts"] = []
+    state["refinement_exit_reason"] = None
+    state["research_evaluation"] = None
+
+
+def refinement_budget_spent(state) -> str | None:
+    """Returns "time_budget" or "token_budget" once that refinement budget is used up."""
+    if _past(state.get("refinement_deadline")):
+        return "time_budget"
+    if config.refinement_token_budget and state.get("refinement_tokens_used", 0) >= config.refinement_token_budget:
+        return "token_budget"
+    return None
+
+
+def start_iteration_callback(callback_context: CallbackContext) -> genai_types.Content | None:
+    """
+    Records when each refinement iteration starts, and skips the evaluator call
+    once the budget is spent so the EscalationChecker can stop the loop right away.
+    """
+    state = callback_context.state
+    state["refinement_iteration_starts"] = state.get("refinement_iteration_starts", []) + [time.time()]
+    budget_spent = refinement_budget_spent(state)
+    if budget_spent:
+        return genai_types.Content(
+            role="model", parts=[genai_types.Part(text=f"Skipped evaluation: {budget_spent} spent.")]
+        )
+    return None
+
+
+def finish_refinement_callback(callback_context: CallbackContext) -> None:
+    """
+    Writes the final loop statistics to state["refinement_stats"]: iterations run
+    against the configured maximum, why the loop stopped, the measured duration of
+    each iteration, total elapsed time and tokens used.
+    """
+    state = callback_context.state
+    now = time.time()
+    starts = state.get("refinement_iteration_starts", [])
+    bounds = starts + [now]
+
+    stats = {
+        "iterations": len(starts),
+        "max_iterations": config.max_search_iterations,
+        "exit_reason": state.get("refinement_exit_reason") or "max_iterations",
+        "iteration_seconds": [round(end - begin, 2) for begin, end in zip(bounds, bounds[1:])],
+        "elapsed_seconds": round(now - state.get("refinement_started_at", now), 2),
+        "tokens_used": state.get("refinement_tokens_used", 0),
+    }
+    state["refinement_stats"] = stats
+    logging.info(f"Research refinement finished: {stats}")
+
+
+def track_refinement_tokens_callback(
+    callback_context: CallbackContext, llm_response: LlmResponse
+) -> None:
+    """Accumulates token usage of the refinement loop's model calls for its token budget."""
+    usage = llm_response.usage_metadata
+    if usage and usage.total_token_count:
+        callback_context.state["refinement_tokens_used"] = (
+            callback_context.state.get("refinement_tokens_used", 0) + usage.total_token_count
+        )
 
 
 def citation_replacement_callback(callback_context: CallbackContext) -> None:
@@ -273,7 +418,10 @@ def citation_replacement_callback(callback_context: CallbackContext) -> None:
 
 # --- Custom Agent for Loop Control ---
 class EscalationChecker(BaseAgent):
-    """Checks research evaluation and escalates to stop the loop if grade is 'pass'."""
+    """
+    Checks research evaluation and escalates to stop the loop if grade is 'pass'
+    or the refinement time/token budget is spent.
+    """
 
     def __init__(self, name: str):
         super().__init__(name=name)
@@ -283,10 +431,20 @@ class EscalationChecker(BaseAgent):
     ) -> AsyncGenerator[Event, None]:
         evaluation_result = ctx.session.state.get("research_evaluation")
         if evaluation_result and evaluation_result.get("grade") == "pass":
+            exit_reason = "pass"
+        else:
+            exit_reason = refinement_budget_spent(ctx.session.state)
+
+        if exit_reason:
             logging.info(
-                f"[{self.name}] Research evaluation passed. Escalating to stop loop."
+                f"[{self.name}] Stopping refinement loop ({exit_reason}). Escalating to stop loop."
+            )
+            yield Event(
+                author=self.name,
+                actions=EventActions(
+                    escalate=True, state_delta={"refinement_exit_reason": exit_reason}
+                ),
             )
-            yield Event(author=self.name, actions=EventActions(escalate=True))
         else:
             logging.info(
                 f"[{self.name}] Research evaluation failed or not found. Loop will continue."
@@ -295,6 +453,75 @@ class EscalationChecker(BaseAgent):
             yield Event(author=self.name)
 
 
+class FollowUpRetriever(BaseAgent):
+    """
+    Fetches papers for the evaluator's follow_up_queries only, skipping papers
+    that are already part of the research, and merges them into state.
+
+    Stops issuing queries once the refinement time budget has passed, and ends the
+    loop when that happens or when no new papers were found, so the contradiction
+    analysis is never re-run over budget or on unchanged inputs.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name=name)
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        state = ctx.session.state
+        evaluation_result = state.get("research_evaluation") or {}
+        queries = [
+            q.get("search_query") for q in evaluation_result.get("follow_up_queries") or []
+            if q.get("search_query")
+        ]
+        paper_id_to_short_id = state.get("paper_id_to_short_id", {})
+        papers = state.get("papers", {})
+
+        deadline = state.get("refinement_deadline")
+        rate_limit_state = {"rate_limit_metrics": state.get("rate_limit_metrics") or {}}
+        new_papers = []
+        for query in queries:
+            if _past(deadline):
+                logging.info(f"[{self.name}] Time budget spent; skipping remaining follow-up queries.")
+                break
+            known_ids = frozenset(paper_id_to_short_id) | {p["paperId"] for p in new_papers}
+            result = await asyncio.to_thread(
+                _retrieve_papers, query,
+                config.follow_up_papers_per_query, config.follow_up_max_pages, known_ids, deadline,
+            )
+            if "message" in result:
+                logging.warning(f"[{self.name}] Follow-up query failed: {query!r}: {result['message']}")
+            new_papers.extend(result.get("papers", []))
+            record_rate_limit_metrics(rate_limit_state, result)
+
+        logging.info(
+            f"[{self.name}] {len(new_papers)} new paper(s) from {len(queries)} follow-up query(ies); "
+            f"{len(papers)} reused."
+        )
+        paper_id_to_short_id, papers = _merge_papers(new_papers, paper_id_to_short_id, papers)
+        state_delta = {
+            "paper_id_to_short_id": paper_id_to_short_id,
+            "papers": papers,
+            "retrieved_papers": {"status": "success", "papers": list(papers.values())},
+            "rate_limit_metrics": rate_limit_state["rate_limit_metrics"],
+        }
+        if _past(deadline):
+            exit_reason = "time_budget"
+        elif not new_papers:
+            exit_reason = "no_new_evidence"
+        else:
+            exit_reason = None
+        escalate = exit_reason is not None
+        if escalate:
+            state_delta["refinement_exit_reason"] = exit_reason
+            logging.info(f"[{self.name}] Stopping refinement loop ({exit_reason}). Escalating to stop loop.")
+        yield Event(
+            author=self.name,
+            actions=EventActions(escalate=escalate, state_delta=state_delta),
+        )
+
+
 # --- AGENT DEFINITIONS ---
 plan_generator = LlmAgent(
     model=config.worker_model,
@@ -332,13 +559,51 @@ retriever_agent = LlmAgent(
 #     papers_path=BASE_PAPERS_PATH,
 #     current_date=datetime.datetime.now().strftime("%Y-%m-%d")
 # )
-contra_agent = LlmAgent(
-    name="contra_agent",
-    model=config.worker_model,
-    description="Analyzes all downloaded clinical research PDFs and identifies contradictions, agreements, and insights.",
-    instruction=BASE_CONTRA_AGENT_PROMPT,
-    tools=[load_all_pdfs],
-    output_key="contradictions"
+def create_contra_agent(name: str, **kwargs) -> LlmAgent:
+    """Builds a contradiction analysis agent; ADK agents can only have a single parent."""
+    return LlmAgent(
+        name=name,
+        model=config.worker_model,
+        description="Analyzes all downloaded clinical research PDFs and identifies contradictions, agreements, and insights.",
+        instruction=BASE_CONTRA_AGENT_PROMPT,
+        tools=[load_all_pdfs],
+        output_key="contradictions",
+        **kwargs,
+    )
+
+
+contra_agent = create_contra_agent("contra_agent")
+
+
+research_evaluator = LlmAgent(
+    model=config.critic_model,
+    name="research_evaluator",
+    include_contents="none",
+    description="Grades evidence coverage of the retrieved papers and contradiction analysis.",
+    instruction=RESEARCH_EVALUATOR_PROMPT,
+    output_schema=Feedback,
+    disallow_transfer_to_parent=True,
+    disallow_transfer_to_peers=True,
+    output_key="research_evaluation",
+    before_agent_callback=start_iteration_callback,
+    after_model_callback=track_refinement_tokens_callback,
+)
+
+
+iterative_refinement_loop = LoopAgent(
+    name="iterative_refinement_loop",
+    description="Re-evaluates coverage and fetches follow-up papers until the research passes or the budget runs out.",
+    max_iterations=config.max_search_iterations,
+    sub_agents=[
+        research_evaluator,
+        EscalationChecker(name="escalation_checker"),
+        FollowUpRetriever(name="follow_up_retriever"),
+        create_contra_agent(
+            "contra_refiner", after_model_callback=track_refinement_tokens_callback
+        ),
+    ],
+    before_agent_callback=start_refinement_callback,
+    after_agent_callback=finish_refinement_callback,
 )
 
 
@@ -375,6 +640,7 @@ neuroloom_pipeline = SequentialAgent(
         section_planner,
         retriever_agent,
         contra_agent,
+        *([iterative_refinement_loop] if config.enable_research_refinement else []),
         hypothesis_agent, 
         report_composer,  
     ],
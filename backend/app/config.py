@@ -13,7 +13,7 @@
 # limitations under the License.
 
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import google.auth
 
@@ -36,11 +36,44 @@ class ResearchConfiguration:
         critic_model (str): Model for evaluation tasks.
         worker_model (str): Model for working/generation tasks.
         max_search_iterations (int): Maximum search iterations allowed.
+        enable_research_refinement (bool): Whether to run the evaluate-and-refine loop after retrieval.
+        refinement_time_budget_seconds (float): Wall-clock budget of the refinement loop (0 disables the limit).
+        refinement_token_budget (int): Model token budget of the refinement loop (0 disables the limit).
+        follow_up_papers_per_query (int): New papers fetched for each follow-up query.
+        follow_up_max_pages (int): Search result pages scanned for each follow-up query.
+        papers_path (str): Shared paper cache directory; the only directory the tools read, write or clean up.
+        paper_lock_timeout (float): Seconds a worker waits for another worker's download of the same paper,
+            on top of the rate limiter's wait budget for that download.
+        paper_cache_max_bytes (int): Size limit of the shared papers directory (0 disables the limit).
+        paper_cache_max_age_seconds (float): Age after which cached papers are evicted (0 disables the limit).
+        rate_limit_requests_per_second (float): Default request rate allowed per host.
+        rate_limit_burst (int): Requests a host may receive back-to-back before the rate applies.
+        rate_limit_host_overrides (dict[str, float]): Per-host request rates, keyed by hostname.
+        rate_limit_min_rate (float): Floor the adaptive backoff will not go below.
+        rate_limit_max_retries (int): Retries for a request answered with 429/503.
+        rate_limit_max_wait (float): Longest a request waits for a token before it is dropped.
     """
 
     critic_model: str = "gemini-2.5-pro"
     worker_model: str = "gemini-2.5-flash"
     max_search_iterations: int = 5
+    enable_research_refinement: bool = False
+    refinement_time_budget_seconds: float = 600.0
+    refinement_token_budget: int = 500_000
+    follow_up_papers_per_query: int = 2
+    follow_up_max_pages: int = 5
+    papers_path: str = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "papers"))
+    paper_lock_timeout: float = 120.0
+    paper_cache_max_bytes: int = 2 * 1024**3
+    paper_cache_max_age_seconds: float = 7 * 24 * 3600
+    rate_limit_requests_per_second: float = 2.0
+    rate_limit_burst: int = 4
+    rate_limit_host_overrides: dict[str, float] = field(
+        default_factory=lambda: {"www.ebi.ac.uk": 5.0}
+    )
+    rate_limit_min_rate: float = 0.1
+    rate_limit_max_retries: int = 3
+    rate_limit_max_wait: float = 60.0
 
 
 config = ResearchConfiguration()
@@ -0,0 +1,256 @@
+import os
+import sys
+import time
+import logging
+
+from contextlib import contextmanager
+from collections.abc import Callable, Iterator
+from typing import BinaryIO
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+from .config import config
+from .rate_limit import max_request_wait
+
+
+# --- Shared Paper Cache ---
+# Every worker process writes into the same papers directory, so all access to a
+# given `{paper_id}.pdf` is coordinated through an OS-level lock file.  Downloads
+# land in a hidden `.part` file and are atomically renamed into place, which means
+# anything ending in `.pdf` is always a complete file.
+
+LOCK_DIR_NAME = ".locks"
+PARTIAL_SUFFIX = ".part"
+
+
+def _lock_path(directory: str, paper_id: str) -> str:
+    """Returns the lock file path guarding a single paper."""
+    lock_dir = os.path.join(directory, LOCK_DIR_NAME)
+    os.makedirs(lock_dir, exist_ok=True)
+    return os.path.join(lock_dir, f"{paper_id}.lock")
+
+
+def _try_lock(fd: int, shared: bool = False) -> bool:
+    """Attempts a non-blocking lock on an open file descriptor."""
+    try:
+        if sys.platform == "win32":
+            # msvcrt has no shared locks, so readers serialize on Windows.
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(fd: int) -> None:
+    """Releases a lock taken with `_try_lock`."""
+    if sys.platform == "win32":
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def _is_current(fd: int, path: str) -> bool:
+    """Checks that `fd` still refers to the lock file at `path` (GC may have removed it)."""
+    try:
+        on_disk = os.stat(path)
+    except FileNotFoundError:
+        return False
+    held = os.fstat(fd)
+    return (on_disk.st_dev, on_disk.st_ino) == (held.st_dev, held.st_ino)
+
+
+@contextmanager
+def paper_lock(directory: str, paper_id: str, timeout: float | None = None,
+               blocking: bool = True, shared: bool = False) -> Iterator[bool]:
+    """
+    Holds the cross-process lock for `paper_id` for the duration of the block.
+
+    Readers take it `shared`; downloads and garbage collection take it exclusively.
+    Yields True once the lock is held. With `blocking=False` (or when `timeout`
+    expires) it yields False instead of raising, so callers can skip the paper.
+
+    The default timeout covers a download that is waiting on the rate limiter, so
+    a throttled host does not make other workers give up on the paper.
+    """
+    if timeout is None:
+        timeout = config.paper_lock_timeout + max_request_wait()
+    lock_path = _lock_path(directory, paper_id)
+    deadline = time.monotonic() + timeout
+    fd = None
+    acquired = False
+    try:
+        while True:
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            acquired = _try_lock(fd, shared)
+            if acquired and _is_current(fd, lock_path):
+                break
+            # Either the lock is busy or GC unlinked the file we opened; start over.
+            if acquired:
+                _unlock(fd)
+                acquired = False
+            os.close(fd)
+            fd = None
+            if not blocking or time.monotonic() >= deadline:
+                break
+            time.sleep(0.1)
+        yield acquired
+    finally:
+        if acquired:
+            _unlock(fd)
+        if fd is not None:
+            os.close(fd)
+
+
+def _touch(path: str) -> bool:
+    """Refreshes `path` for the age/size based collector. Returns False if it is gone."""
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def fetch_cached_pdf(url: str, directory: str, paper_id: str,
+                     downloader: Callable[[str, str], None]) -> str:
+    """
+    Returns the path of `{paper_id}.pdf` in the shared cache, downloading it if needed.
+
+    Only one process downloads a given paper; the others wait on its lock and then
+    reuse the finished file. Raises TimeoutError if the lock cannot be acquired.
+    """
+    pdf_path = os.path.join(directory, f"{paper_id}.pdf")
+
+    with paper_lock(directory, paper_id, shared=True) as acquired:
+        if acquired and _touch(pdf_path):
+            return pdf_path
+
+    with paper_lock(directory, paper_id) as acquired:
+        if not acquired:
+            raise TimeoutError(f"Timed out waiting for lock on paper {paper_id}")
+
+        # Another worker may have finished the download while we were waiting.
+        if _touch(pdf_path):
+            return pdf_path
+
+        partial_path = os.path.join(
+            directory, f".{paper_id}.{os.getpid()}{PARTIAL_SUFFIX}"
+        )
+        try:
+            downloader(url, partial_path)
+            os.replace(partial_path, pdf_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    return pdf_path
+
+
+@contextmanager
+def open_cached_pdf(url: str, directory: str, paper_id: str,
+                    downloader: Callable[[str, str], None]) -> Iterator[BinaryIO]:
+    """
+    Opens `{paper_id}.pdf` for reading under a shared lock, so GC cannot evict it
+    while it is in use. A paper evicted since it was retrieved is downloaded again.
+    """
+    pdf_path = os.path.join(directory, f"{paper_id}.pdf")
+    for _ in range(3):
+        fetch_cached_pdf(url, directory, paper_id, downloader)
+        with paper_lock(directory, paper_id, shared=True) as acquired:
+            if not acquired:
+                raise TimeoutError(f"Timed out waiting for lock on paper {paper_id}")
+            if os.path.exists(pdf_path):
+                with open(pdf_path, "rb") as file:
+                    yield file
+                return
+    raise FileNotFoundError(f"Paper {paper_id} keeps being evicted from {directory}")
+
+
+def _remove_lock_file(directory: str, paper_id: str) -> None:
+    """Removes a paper's lock file; must be called while holding its exclusive lock."""
+    try:
+        os.remove(os.path.join(directory, LOCK_DIR_NAME, f"{paper_id}.lock"))
+    except OSError:  # already gone, or still open elsewhere on Windows
+        pass
+
+
+def collect_garbage(directory: str, max_bytes: int | None = None,
+                    max_age_seconds: float | None = None) -> dict:
+    """
+    Trims the shared paper cache by age and total size.
+
+    Papers older than `max_age_seconds` are removed first, then the least recently
+    used ones until the directory fits in `max_bytes`. Papers that are locked by a
+    reader or downloader are left alone, as are partial downloads that are still
+    fresh. Lock files are removed together with their paper.
+    """
+    if max_bytes is None:
+        max_bytes = config.paper_cache_max_bytes
+    if max_age_seconds is None:
+        max_age_seconds = config.paper_cache_max_age_seconds
+
+    if not os.path.isdir(directory):
+        return {"removed": [], "total_bytes": 0}
+
+    now = time.time()
+    entries = []
+    for fname in os.listdir(directory):
+        path = os.path.join(directory, fname)
+        if not os.path.isfile(path):
+            continue
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if fname.endswith(PARTIAL_SUFFIX):
+            # Leftovers from crashed workers; live downloads keep their mtime fresh.
+            if now - stat.st_mtime > config.paper_lock_timeout:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            continue
+        if fname.lower().endswith(".pdf"):
+            entries.append((stat.st_mtime, stat.st_size, fname))
+
+    entries.sort()  # oldest first
+    total_bytes = sum(size for _, size, _ in entries)
+    removed = []
+
+    for mtime, size, fname in entries:
+        expired = max_age_seconds and now - mtime > max_age_seconds
+        oversized = max_bytes and total_bytes > max_bytes
+        if not (expired or oversized):
+            continue
+        paper_id = os.path.splitext(fname)[0]
+        with paper_lock(directory, paper_id, blocking=False) as acquired:
+            if not acquired:
+                continue
+            try:
+                os.remove(os.path.join(directory, fname))
+            except FileNotFoundError:
+                continue
+            _remove_lock_file(directory, paper_id)
+        total_bytes -= size
+        removed.append(fname)
+
+    # Lock files left behind by papers that were never downloaded successfully.
+    lock_dir = os.path.join(directory, LOCK_DIR_NAME)
+    if os.path.isdir(lock_dir):
+        for lock_name in os.listdir(lock_dir):
+            paper_id = os.path.splitext(lock_name)[0]
+            if os.path.exists(os.path.join(directory, f"{paper_id}.pdf")):
+                continue
+            with paper_lock(directory, paper_id, blocking=False) as acquired:
+                if acquired and not os.path.exists(os.path.join(directory, f"{paper_id}.pdf")):
+                    _remove_lock_file(directory, paper_id)
+
+    if removed:
+        logging.info(f"Paper cache GC removed {len(removed)} file(s) from {directory}")
+    return {"removed": removed, "total_bytes": total_bytes}
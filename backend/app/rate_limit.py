@@ -0,0 +1,219 @@
+import time
+import logging
+import threading
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+
+from .config import config
+
+
+# --- Client-side Rate Limiting ---
+# One token bucket per host, shared by every session in the process. Buckets slow
+# down multiplicatively when a host answers 429/503 and recover additively on
+# success, so concurrent sessions converge on whatever rate the host tolerates.
+
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request is dropped because the host keeps throttling us."""
+
+
+@dataclass
+class HostMetrics:
+    """Counters reported by `get_rate_limit_metrics` and `track_rate_limits`."""
+
+    requests: int = 0
+    throttled: int = 0
+    retries: int = 0
+    dropped: int = 0
+    wait_seconds: float = 0.0
+
+
+class TokenBucket:
+    """Thread-safe token bucket with adaptive (AIMD) refill rate for a single host."""
+
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.metrics = HostMetrics()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, max_wait: float) -> bool:
+        """Takes one token, sleeping as needed. Returns False if it would wait past `max_wait`."""
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                delay = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            if now + delay > deadline:
+                return False
+            time.sleep(delay)
+            with self._lock:
+                self.metrics.wait_seconds += delay
+
+    def on_throttled(self, retry_after: float | None) -> float:
+        """Halves the rate and pauses the host. Returns the pause in seconds."""
+        with self._lock:
+            self.metrics.throttled += 1
+            self.rate = max(self.rate / 2, config.rate_limit_min_rate)
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+            self.tokens = 0.0
+        logging.warning(f"Host throttled request; backing off to {self.rate:.2f} req/s for {pause:.1f}s")
+        return pause
+
+    def record_request(self, retry: bool) -> None:
+        with self._lock:
+            self.metrics.requests += 1
+            if retry:
+                self.metrics.retries += 1
+
+    def record_drop(self) -> None:
+        with self._lock:
+            self.metrics.dropped += 1
+
+    def on_success(self) -> None:
+        """Slowly restores the rate towards the configured maximum."""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.metrics.requests,
+                "throttled": self.metrics.throttled,
+                "retries": self.metrics.retries,
+                "dropped": self.metrics.dropped,
+                "wait_seconds": round(self.metrics.wait_seconds, 3),
+                "current_rate": self.rate,
+            }
+
+
+_buckets: dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+# Per-run counters, set by `track_rate_limits` for the current thread/task only.
+_run_metrics: ContextVar[dict[str, HostMetrics] | None] = ContextVar(
+    "rate_limit_run_metrics", default=None
+)
+
+
+@contextmanager
+def track_rate_limits() -> Iterator[dict[str, HostMetrics]]:
+    """
+    Collects per-host metrics for the requests made inside the block, separately
+    from the process-wide totals which mix in every other session.
+    """
+    metrics: dict[str, HostMetrics] = {}
+    token = _run_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _run_metrics.reset(token)
+
+
+def summarize_rate_limits(metrics: dict[str, HostMetrics]) -> dict:
+    """Turns metrics from `track_rate_limits` into a JSON-friendly dict with current rates."""
+    current = get_rate_limit_metrics()
+    return {
+        host: {
+            **asdict(m),
+            "wait_seconds": round(m.wait_seconds, 3),
+            "current_rate": current.get(host, {}).get("current_rate"),
+        }
+        for host, m in metrics.items()
+    }
+
+
+def get_bucket(host: str) -> TokenBucket:
+    """Returns the process-wide bucket for `host`, creating it from config on first use."""
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            rate = config.rate_limit_host_overrides.get(host, config.rate_limit_requests_per_second)
+            bucket = TokenBucket(rate, config.rate_limit_burst)
+            _buckets[host] = bucket
+        return bucket
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    """Parses a Retry-After header given either in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def max_request_wait() -> float:
+    """Longest a single `rate_limited_get` call can spend waiting for tokens before it gives up."""
+    return (config.rate_limit_max_retries + 1) * config.rate_limit_max_wait
+
+
+def rate_limited_get(url: str, **kwargs) -> requests.Response:
+    """
+    `requests.get` routed through the bucket of the URL's host.
+
+    Retries 429/503 responses with adaptive backoff and raises RateLimitExceeded
+    once the retries or the wait budget in `ResearchConfiguration` are used up.
+    """
+    host = urlsplit(url).netloc.lower()
+    bucket = get_bucket(host)
+    run_metrics = _run_metrics.get()
+    run = run_metrics.setdefault(host, HostMetrics()) if run_metrics is not None else HostMetrics()
+
+    for attempt in range(config.rate_limit_max_retries + 1):
+        started = time.monotonic()
+        acquired = bucket.acquire(config.rate_limit_max_wait)
+        run.wait_seconds += time.monotonic() - started
+        if not acquired:
+            break
+        bucket.record_request(retry=attempt > 0)
+        run.requests += 1
+        if attempt:
+            run.retries += 1
+
+        response = requests.get(url, **kwargs)
+        if response.status_code not in THROTTLE_STATUS_CODES:
+            bucket.on_success()
+            return response
+
+        run.throttled += 1
+        bucket.on_throttled(_parse_retry_after(response.headers.get("Retry-After")))
+        response.close()
+
+    bucket.record_drop()
+    run.dropped += 1
+    raise RateLimitExceeded(f"Dropped request to {host}: rate limited by host")
+
+
+def get_rate_limit_metrics() -> dict:
+    """Returns a snapshot of per-host rate limiter metrics."""
+    with _buckets_lock:
+        buckets = dict(_buckets)
+    return {host: bucket.snapshot() for host, bucket in buckets.items()}
@@ -0,0 +1,105 @@
+import os
+import time
+import threading
+
+import pytest
+
+from app import paper_cache
+from app.paper_cache import collect_garbage, fetch_cached_pdf, open_cached_pdf, paper_lock
+
+
+@pytest.fixture(autouse=True)
+def short_lock_timeout(monkeypatch):
+    monkeypatch.setattr(paper_cache.config, "paper_lock_timeout", 5.0)
+
+
+def make_downloader(calls: list, delay: float = 0.0, payload: bytes = b"%PDF-1.4 test"):
+    def download(url: str, path: str) -> None:
+        calls.append(url)
+        with open(path, "wb") as f:
+            f.write(payload[:4])
+            time.sleep(delay)
+            f.write(payload[4:])
+    return download
+
+
+def test_concurrent_fetches_download_once(tmp_path):
+    calls = []
+    download = make_downloader(calls, delay=0.3)
+    paths = []
+
+    def worker():
+        paths.append(fetch_cached_pdf("https://example.org/p1.pdf", str(tmp_path), "P1", download))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert paths == [str(tmp_path / "P1.pdf")] * 4
+    assert (tmp_path / "P1.pdf").read_bytes() == b"%PDF-1.4 test"
+
+
+def test_failed_download_leaves_no_files(tmp_path):
+    def download(url: str, path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(b"%PDF")
+        raise ConnectionError("connection reset")
+
+    with pytest.raises(ConnectionError):
+        fetch_cached_pdf("https://example.org/p1.pdf", str(tmp_path), "P1", download)
+
+    assert not [f for f in os.listdir(tmp_path) if not f.startswith(".locks")]
+
+
+def test_gc_skips_papers_under_shared_lock(tmp_path):
+    calls = []
+    download = make_downloader(calls)
+    fetch_cached_pdf("https://example.org/p1.pdf", str(tmp_path), "P1", download)
+
+    with paper_lock(str(tmp_path), "P1", shared=True) as acquired:
+        assert acquired
+        result = collect_garbage(str(tmp_path), max_bytes=1, max_age_seconds=0)
+        assert result["removed"] == []
+        assert (tmp_path / "P1.pdf").exists()
+
+    result = collect_garbage(str(tmp_path), max_bytes=1, max_age_seconds=0)
+    assert result["removed"] == ["P1.pdf"]
+    assert not (tmp_path / "P1.pdf").exists()
+    assert not (tmp_path / ".locks" / "P1.lock").exists()
+
+
+def test_gc_evicts_expired_papers_oldest_first(tmp_path):
+    download = make_downloader([])
+    for paper_id in ("OLD", "NEW"):
+        fetch_cached_pdf(f"https://example.org/{paper_id}.pdf", str(tmp_path), paper_id, download)
+    week_ago = time.time() - 7 * 24 * 3600
+    os.utime(tmp_path / "OLD.pdf", (week_ago, week_ago))
+
+    result = collect_garbage(str(tmp_path), max_bytes=0, max_age_seconds=24 * 3600)
+
+    assert result["removed"] == ["OLD.pdf"]
+    assert (tmp_path / "NEW.pdf").exists()
+
+
+def test_gc_removes_orphaned_lock_files(tmp_path):
+    with pytest.raises(ZeroDivisionError):
+        fetch_cached_pdf("https://example.org/p1.pdf", str(tmp_path), "P1", lambda url, path: 1 / 0)
+    assert (tmp_path / ".locks" / "P1.lock").exists()
+
+    collect_garbage(str(tmp_path), max_bytes=0, max_age_seconds=0)
+
+    assert not (tmp_path / ".locks" / "P1.lock").exists()
+
+
+def test_open_cached_pdf_redownloads_evicted_paper(tmp_path):
+    calls = []
+    download = make_downloader(calls)
+    fetch_cached_pdf("https://example.org/p1.pdf", str(tmp_path), "P1", download)
+    collect_garbage(str(tmp_path), max_bytes=1, max_age_seconds=0)
+
+    with open_cached_pdf("https://example.org/p1.pdf", str(tmp_path), "P1", download) as file:
+        assert file.read() == b"%PDF-1.4 test"
+    assert len(calls) == 2
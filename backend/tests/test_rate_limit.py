@@ -0,0 +1,67 @@
+import pytest
+
+from app import rate_limit
+from app.rate_limit import RateLimitExceeded, TokenBucket, rate_limited_get, track_rate_limits
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, headers: dict | None = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture(autouse=True)
+def fresh_buckets(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_buckets", {})
+    monkeypatch.setattr(rate_limit.config, "rate_limit_requests_per_second", 1000.0)
+    monkeypatch.setattr(rate_limit.config, "rate_limit_host_overrides", {})
+    monkeypatch.setattr(rate_limit.config, "rate_limit_min_rate", 100.0)
+    monkeypatch.setattr(rate_limit.config, "rate_limit_max_retries", 2)
+    monkeypatch.setattr(rate_limit.config, "rate_limit_max_wait", 1.0)
+
+
+def fake_get(monkeypatch, responses: list):
+    monkeypatch.setattr(rate_limit.requests, "get", lambda url, **kwargs: responses.pop(0))
+
+
+def test_throttled_request_is_retried(monkeypatch):
+    fake_get(monkeypatch, [FakeResponse(429, {"Retry-After": "0"}), FakeResponse(200)])
+
+    with track_rate_limits() as metrics:
+        response = rate_limited_get("https://example.org/search")
+
+    assert response.status_code == 200
+    run = metrics["example.org"]
+    assert (run.requests, run.throttled, run.retries, run.dropped) == (2, 1, 1, 0)
+
+
+def test_request_dropped_after_retries(monkeypatch):
+    fake_get(monkeypatch, [FakeResponse(503, {"Retry-After": "0"}) for _ in range(3)])
+
+    with track_rate_limits() as metrics:
+        with pytest.raises(RateLimitExceeded):
+            rate_limited_get("https://example.org/search")
+
+    run = metrics["example.org"]
+    assert (run.requests, run.throttled, run.dropped) == (3, 3, 1)
+    assert rate_limit.get_rate_limit_metrics()["example.org"]["dropped"] == 1
+
+
+def test_throttling_halves_rate_and_success_recovers():
+    bucket = TokenBucket(rate=1000.0, burst=1)
+
+    bucket.on_throttled(retry_after=0)
+    assert bucket.rate == 500.0
+
+    bucket.on_success()
+    assert bucket.rate == 600.0
+
+
+def test_acquire_gives_up_past_max_wait():
+    bucket = TokenBucket(rate=0.01, burst=1)
+
+    assert bucket.acquire(max_wait=0.1)
+    assert not bucket.acquire(max_wait=0.1)
@@ -213,6 +213,12 @@ export default function App() {
         return "Executing Research Pipeline";
       case "iterative_refinement_loop":
         return "Refining Research";
+      case "research_evaluator":
+        return "Evaluating Research Coverage";
+      case "follow_up_retriever":
+        return "Retrieving Follow-up Papers";
+      case "contra_refiner":
+        return "Re-analyzing for Contradictions";
       case "interactive_planner_agent":
       case "root_agent":
         return "Interactive Planning";